@@ -15,6 +15,8 @@ intervals = 1000
 eval_iterations = 20000
 run_name = ''
 abstraction = "sim_hand"
+discount_period = 0
+initial_discount = None
 FLAGS = None
 
 def main():
@@ -25,7 +27,8 @@ def main():
         "naive": naive
     }
     abstraction_func(FLAGS.suits, FLAGS.ranks, FLAGS.hand_size, FLAGS.starting_iterations, FLAGS.train_iterations,
-                     FLAGS.intervals, FLAGS.eval_iterations, FLAGS.run_name, abstraction_functions[FLAGS.abstraction])
+                     FLAGS.intervals, FLAGS.eval_iterations, FLAGS.run_name, abstraction_functions[FLAGS.abstraction],
+                     FLAGS.discount_period, FLAGS.initial_discount)
 
 
 if __name__ == '__main__':
@@ -52,6 +55,10 @@ if __name__ == '__main__':
                         help='Name for the run/saved infodict')
     parser.add_argument('--abstraction', type=str, default=abstraction,
                         help='Abstraction type')
+    parser.add_argument('--discount_period', type=int, default=discount_period,
+                        help='Number of visited nodes between discounts of the regrets, 0 for no discounting')
+    parser.add_argument('--initial_discount', type=int, default=initial_discount,
+                        help='Number of discounts after which discounting stops, keeps discounting if not given')
     FLAGS, unparsed = parser.parse_known_args()
     config.update(FLAGS)
 
@@ -25,7 +25,8 @@ def suit(hand, trump, hist, pos, mean):
 
 
 def advanced(hand, trump, hist, pos, mean):
-    """Abstract away the hand to a list containing avg hand, number of suits and number of high cards"""
+    """Abstract away the hand to a sorted tuple of the distinct values of avg hand, number of suits and number of
+    high cards"""
     if len(hand) == 0:
         hand_str = 0
     else:
@@ -35,6 +36,6 @@ def advanced(hand, trump, hist, pos, mean):
     for card in hand:
         suits.add(card[0])
     high_cards = len([x for x in hand if x[1] > mean])
-    new_hand = [hand_str, len(suits), high_cards]
+    new_hand = tuple(sorted({hand_str, len(suits), high_cards}))
 
     return new_hand, trump, hist
@@ -7,16 +7,18 @@ from Play import Play
 import wandb
 
 
-def exploit(suits, ranks, hand_size, starting_iterations, train_iterations, intervals, eval_iterations, name):
+def exploit(suits, ranks, hand_size, starting_iterations, train_iterations, intervals, eval_iterations, name,
+            max_cached_trees=0):
     """Function to run the MCCFR experiment.
     params:
     train_iterations: total number of iterations
     interval: number of intervals for eval
-    eval_iteration: number of iterations for each eval"""
+    eval_iteration: number of iterations for each eval
+    max_cached_trees: number of game trees kept for the evaluations, 0 to evaluate through the game"""
     iterations_per_interval = int(train_iterations / intervals)
     deck = Deck(suits, ranks)
     game = Game(deck, hand_size)
-    mccfr = MCCFR(game, identity)
+    mccfr = MCCFR(game, identity, max_cached_trees=max_cached_trees)
     if starting_iterations != 0:
         mccfr.train_external(starting_iterations)
         wandb.log({f"exploitability": mccfr.get_exploitability(eval_iterations),
@@ -107,19 +109,22 @@ def full_abstraction(suits, ranks, hand_size, starting_iterations, train_iterati
         mccfr_abs_sim.save_dict(name + '_simple')
 
 
-def abstraction_func(suits, ranks, hand_size, starting_iterations, train_iterations, intervals, eval_iterations, name, abstraction):
+def abstraction_func(suits, ranks, hand_size, starting_iterations, train_iterations, intervals, eval_iterations, name, abstraction,
+                     discount_period=0, initial_discount=None):
     """Function to run the abstraction experiment.
     params:
     train_iterations: total number of iterations
     interval: number of intervals for eval
     eval_iteration: number of iterations for each eval
-    abstraction: the abstraction function"""
+    abstraction: the abstraction function
+    discount_period: number of visited nodes between discounts, 0 for no discounting
+    initial_discount: number of discounts after which discounting stops, None to keep discounting"""
 
     iterations_per_interval = int(train_iterations / intervals)
     deck = Deck(suits, ranks)
     game = Game(deck, hand_size)
-    mccfr = MCCFR(game, identity)
-    mccfr_abs = MCCFR(game, abstraction)
+    mccfr = MCCFR(game, identity, discount_period, initial_discount)
+    mccfr_abs = MCCFR(game, abstraction, discount_period, initial_discount)
 
     infoset_size_normal = sum(mccfr.count_infosets())
     infoset_size_abs = sum(mccfr_abs.count_infosets())
@@ -1,17 +1,19 @@
-import random
-from copy import deepcopy
 import numpy as np
 
 
 class Game:
     """Class which keeps track of the rules of the game."""
 
-    def __init__(self, deck, handsize):
-        """Initialize a game for a given deck and handsize."""
+    def __init__(self, deck, handsize, seed=None):
+        """Initialize a game for a given deck and handsize. The random generator of the game is shared by everything
+        that samples during training, so a seed makes training reproducible."""
         self.deck = deck
         self.handsize = handsize
         self.deck.reset_deck()
         self.mean = np.mean(deck.ranks)
+        self.bets = np.arange(self.handsize + 1)
+        self.rng = np.random.default_rng(seed)
+        self.deck_ids = np.arange(len(deck.deck2))
 
     def suit_abstraction_dict(self, hand, trump):
         """Function to create a suit dict for card isomorphism. Each suit is mapped to an abstraction which
@@ -21,11 +23,9 @@ class Game:
         suit_dict = {}
         check_val = set()
 
-        hand.sort(key=lambda x: x[1])
-
         suit_dict[trump[0]] = suit_abstraction[len(suits) - 1]
 
-        for card in hand:
+        for card in sorted(hand, key=lambda x: x[1]):
             if card[0] not in check_val and card[0] != trump[0]:
                 suit_dict[card[0]] = suit_abstraction[len(check_val)]
                 check_val.add(card[0])
@@ -62,56 +62,64 @@ class Game:
         active_player = 0 or 1 for player 0 or 1.
         cards = a list of 2 lists and one trump, one list for each player, the lists contain cards which are tuples of the form: (suit, rank)
         history = tuple containing all actions in order
-        player_wins = the amount of wins both players have gotten
+        player_wins = tuple with the amount of wins both players have gotten
         terminal = boolean indicating whether the state is terminal
         suit_dicts = list of suit dicts, one for each player"""
         if hands:
             cards = [sorted(hands[0]), sorted(hands[1]), hands[2]]
             suit_dicts = [self.suit_abstraction_dict(hands[0], hands[2]), self.suit_abstraction_dict(hands[1], hands[2])]
-            return (0, cards, (), np.zeros(2, dtype=int), False, suit_dicts)
+            return (0, cards, (), (0, 0), False, suit_dicts)
         else:
-            game_cards = random.sample(self.deck.deck2, 2 * self.handsize + 1)
+            self.rng.shuffle(self.deck_ids)
+            game_cards = [self.deck.deck2[i] for i in self.deck_ids[:2 * self.handsize + 1].tolist()]
             cards = [sorted(game_cards[self.handsize + 1:]), sorted(game_cards[:self.handsize]), game_cards[self.handsize]]
             suit_dicts = [self.suit_abstraction_dict(cards[0], cards[2]), self.suit_abstraction_dict(cards[1], cards[2])]
-            return (0, cards, (), np.zeros(2, dtype=int), False, suit_dicts)
+            return (0, cards, (), (0, 0), False, suit_dicts)
 
     def get_possible_actions(self, game_state):
-        """Function which uses a game state to determine the possible actions as a list from this game state."""
-        cards = sorted(game_state[1][game_state[0]])
-
-        if len(game_state[2]) < 2:
-            return np.arange(self.handsize + 1)
-        elif len(game_state[2]) % 2 == 0:
+        """Function which uses a game state to determine the possible actions as a list from this game state.
+        Hands are kept sorted and are shared between game states, so the result must not be modified."""
+        cards = game_state[1][game_state[0]]
+        history = game_state[2]
+
+        if len(history) < 2:
+            return self.bets
+        elif len(history) % 2 == 0:
             return cards
         else:
             # Players have to play the same suit, unless they can not.
-            possible = [i for i in cards if i[0] == game_state[2][-1][0]]
+            lead_suit = history[-1][0]
+            possible = [i for i in cards if i[0] == lead_suit]
             if len(possible) == 0:
                 return cards
             else:
                 return possible
 
     def get_next_game_state(self, game_state, action):
-        """Function which returns a new game state, based on the previous game state and the action taken."""
+        """Function which returns a new game state, based on the previous game state and the action taken. Only the
+        parts of the game state which change are copied, the rest is shared with the previous game state."""
         terminal = False
         
         next_active_player = (game_state[0] + 1) % 2
-        next_hands = deepcopy(game_state[1])
+        next_hands = list(game_state[1])
         history = game_state[2] + (action,)
-        player_wins = deepcopy(game_state[3])
+        player_wins = game_state[3]
 
         if len(history) == 2 * self.handsize + 2:
             terminal = True
 
         if not isinstance(action, np.int64):
-            next_hands[game_state[0]].remove(action)
+            next_hands[game_state[0]] = [card for card in next_hands[game_state[0]] if card != action]
 
         # The same player only plays twice in a row if they win a round as a reacting player.
         if len(history) > 2 and len(history) % 2 == 0 and (action[0] == game_state[2][-1][0] and game_state[2][-1][1] < action[1] or action[0] == game_state[1][2][0] and game_state[2][-1][0] != game_state[1][2][0]):
             next_active_player = game_state[0]
         
         if len(history) > 2 and len(history) % 2 == 0:
-            player_wins[next_active_player] += 1
+            if next_active_player == 0:
+                player_wins = (player_wins[0] + 1, player_wins[1])
+            else:
+                player_wins = (player_wins[0], player_wins[1] + 1)
 
         return (next_active_player, next_hands, history, player_wins, terminal, game_state[5])
     
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class GameTree:
+    """Class which stores the game tree of a single deal in flat arrays, so it can be traversed by integer indexing
+    instead of through the game. Chains of forced actions are folded into the edges, so every node is either a
+    decision with multiple actions or terminal. Node 0 is the root."""
+
+    def __init__(self, mccfr, game_state):
+        """Build the tree from an initial game state, using the game and info keys of an MCCFR instance.
+        player: active player of every node
+        depth: history length of every node, used to pick the scratch buffer of the recursion
+        n_children: number of actions of every node, 0 for terminal nodes
+        children: node index reached by every action, -1 for unused columns
+        edge_sign: sign which converts the value of the child to the value of the node for every action
+        terminal: whether every node is terminal
+        payoff: payoff of terminal nodes for their active player
+        info_id: index into info_keys of the infoset of every decision node, -1 for terminal nodes
+        root_sign: sign which converts the value of the root to the value of the given game state"""
+        nodes = []
+        self.info_keys = []
+        game_state, possible_actions, self.root_sign = mccfr.skip_forced_actions(game_state)
+        _add_node(mccfr, game_state, possible_actions, nodes, self.info_keys, {})
+
+        max_actions = mccfr.game.handsize + 1
+        num_nodes = len(nodes)
+        self.player = np.zeros(num_nodes, dtype=np.int8)
+        self.depth = np.zeros(num_nodes, dtype=np.int8)
+        self.n_children = np.zeros(num_nodes, dtype=np.int8)
+        self.children = np.full((num_nodes, max_actions), -1, dtype=np.int32)
+        self.edge_sign = np.zeros((num_nodes, max_actions), dtype=np.int8)
+        self.terminal = np.zeros(num_nodes, dtype=bool)
+        self.payoff = np.zeros(num_nodes, dtype=np.float32)
+        self.info_id = np.full(num_nodes, -1, dtype=np.int32)
+        for node, (player, depth, payoff, info_id, children, edge_signs) in enumerate(nodes):
+            self.player[node] = player
+            self.depth[node] = depth
+            self.terminal[node] = not children
+            self.payoff[node] = payoff
+            self.info_id[node] = info_id
+            self.n_children[node] = len(children)
+            self.children[node, :len(children)] = children
+            self.edge_sign[node, :len(children)] = edge_signs
+
+    def __len__(self):
+        """Return the number of nodes in the tree."""
+        return len(self.player)
+
+
+def _add_node(mccfr, game_state, possible_actions, nodes, info_keys, key_ids):
+    """Recursively add a node and its subtree to nodes in depth first order and return the index of the node. Every
+    node is a tuple (player, depth, payoff, info_id, children, edge_signs), info_id indexes info_keys and key_ids
+    maps the info_keys seen so far to their index."""
+    node = len(nodes)
+    if game_state[4]:
+        nodes.append((game_state[0], len(game_state[2]), mccfr.game.get_payoff(game_state), -1, [], []))
+        return node
+
+    info_key = mccfr.get_info_key(game_state, possible_actions)
+    if info_key not in key_ids:
+        key_ids[info_key] = len(info_keys)
+        info_keys.append(info_key)
+    children = []
+    edge_signs = []
+    nodes.append((game_state[0], len(game_state[2]), 0, key_ids[info_key], children, edge_signs))
+
+    # The sign follows the return_value convention of MCCFR.chance_cfr
+    return_value = -1
+    for action in possible_actions:
+        next_game_state = mccfr.game.get_next_game_state(game_state, action)
+        if game_state[0] == next_game_state[0]:
+            return_value = 1
+        next_game_state, next_actions, sign = mccfr.skip_forced_actions(next_game_state)
+        children.append(_add_node(mccfr, next_game_state, next_actions, nodes, info_keys, key_ids))
+        edge_signs.append(return_value * sign)
+    return node
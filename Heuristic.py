@@ -1,4 +1,4 @@
-from Infoset import Infoset
+from Infoset import Infoset, make_info_key
 import random
 import itertools
 import numpy as np
@@ -27,7 +27,7 @@ class Heuristic:
         possible_action_len = len(possible_action)
         new_hand, new_hist = self.game.translate_suits(game_state)
         abs_hand, abs_trump, abs_hist = self.abstraction_function(new_hand, game_state[1][2], new_hist, possible_action, self.game.mean)
-        key = (game_state[0], frozenset(abs_hand), abs_trump, abs_hist, possible_action_len)
+        key = make_info_key(game_state[0], abs_hand, abs_trump, abs_hist, possible_action_len)
         return key
 
     def avg_deck(self, game_state):
@@ -1,35 +1,74 @@
 import numpy as np
 
 
+def normalize(strategy):
+    """Normalize a strategy to a valid probability distribution, in place if it has a positive sum."""
+    total = strategy.sum()
+    if total > 0:
+        strategy /= total
+    else:
+        strategy = np.full(len(strategy), 1 / len(strategy), dtype=np.float32)
+    return strategy
+
+
+def regret_matching(cumulative_regrets):
+    """Use regret matching to find the strategy for the given cumulative regrets, returned as a new array."""
+    return normalize(np.maximum(0, cumulative_regrets))
+
+
+def make_info_key(player, abs_hand, abs_trump, abs_hist, num_actions):
+    """Build an info_key from the output of an abstraction function. The abstracted hand is stored as a sorted tuple,
+    so hands which only differ in order share a key."""
+    return player, tuple(sorted(abs_hand)), abs_trump, abs_hist, num_actions
+
+
+def upgrade_info_key(info_key):
+    """Convert an info_key saved while hands were stored as frozensets to the current key, in which the hand is a
+    sorted tuple."""
+    if isinstance(info_key[1], frozenset):
+        return (info_key[0], tuple(sorted(info_key[1]))) + info_key[2:]
+    return info_key
+
+
 class Infoset:
     """Class to represent an information set. Contains functions to update the regret and strategy."""
+
+    __slots__ = ('info_key', 'num_actions', 'cumulative_regrets', 'strategy_sum')
     
-    def __init__(self, info_key):
-        """Initialize an infoset for a given an info_key. The key must contain the number of possible actions."""
+    def __init__(self, info_key, cumulative_regrets=None, strategy_sum=None):
+        """Initialize an infoset for a given an info_key. The key must contain the number of possible actions.
+        The arrays are stored as float32, since regret matching normalizes them anyway. When arrays are given, the
+        infoset works on them in place instead, which is how an InfosetTable hands out its rows."""
         self.info_key = info_key
         self.num_actions = info_key[4]
-        self.cumulative_regrets = np.zeros(self.num_actions)
-        self.strategy_sum = np.zeros(self.num_actions)
-        self.average_strategy = np.repeat(1 / self.num_actions, self.num_actions)
+        if cumulative_regrets is None:
+            cumulative_regrets = np.zeros(self.num_actions, dtype=np.float32)
+        if strategy_sum is None:
+            strategy_sum = np.zeros(self.num_actions, dtype=np.float32)
+        self.cumulative_regrets = cumulative_regrets
+        self.strategy_sum = strategy_sum
+
+    def __setstate__(self, state):
+        """Restore a pickled infoset, including ones pickled before the class had slots. Strategy profiles are saved
+        as an InfosetTable, which pickles its arrays instead of single infosets."""
+        if isinstance(state, tuple):
+            state = state[1]
+        self.__init__(state['info_key'])
+        self.cumulative_regrets = np.asarray(state['cumulative_regrets'], dtype=np.float32)
+        self.strategy_sum = np.asarray(state['strategy_sum'], dtype=np.float32)
 
     def normalize(self, strategy):
         """Normalize a strategy to a valid probability distribution."""
-        if sum(strategy) > 0:
-            strategy /= sum(strategy)
-        else:
-            strategy = np.repeat(1 / self.num_actions, self.num_actions)
-        return strategy
+        return normalize(strategy)
 
     def regret_matching(self):
         """Use regret matching to find the new strategy at an iteration."""
-        strategy = np.maximum(0, self.cumulative_regrets)
-        strategy = self.normalize(strategy)
-        return strategy
-
-    def update_strategy_sum(self, reach_probability):
-        """Update the sum of weighted strategies."""
-        strategy = np.maximum(0, self.cumulative_regrets)
-        strategy = self.normalize(strategy)
+        return regret_matching(self.cumulative_regrets)
+
+    def update_strategy_sum(self, reach_probability, strategy=None):
+        """Update the sum of weighted strategies. The current strategy can be given if it was already computed."""
+        if strategy is None:
+            strategy = self.regret_matching()
         self.strategy_sum += reach_probability * strategy
 
     def heuristic_update(self, index, value=1):
@@ -38,6 +77,4 @@ class Infoset:
 
     def get_average_strategy(self):
         """Return the average strategy from the sum of weighted strategies."""
-        self.average_strategy = self.normalize(self.strategy_sum.copy())
-
-        return self.average_strategy
+        return self.normalize(self.strategy_sum.copy())
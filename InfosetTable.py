@@ -0,0 +1,139 @@
+import numpy as np
+from Infoset import Infoset
+
+
+class InfosetTable:
+    """Class to store all infosets of a strategy profile in dense arrays. Every info_key gets an integer id, which is
+    its row in the arrays of cumulative regrets and strategy sums. For code which does not need the arrays, the table
+    behaves like a dict from info_keys to infosets, which are views on the rows of the table."""
+
+    def __init__(self, max_actions, capacity=1024):
+        """Initialize an empty table for infosets with at most max_actions possible actions."""
+        self.key_to_id = {}
+        self.id_to_key = []
+        self.all_regrets = np.zeros((capacity, max_actions), dtype=np.float32)
+        self.all_strategy_sum = np.zeros((capacity, max_actions), dtype=np.float32)
+
+    @classmethod
+    def from_dict(cls, infoset_dict, max_actions):
+        """Create a table for infosets with at most max_actions possible actions from a dict of infosets, as saved
+        before the table existed."""
+        table = cls(max_actions, max(len(infoset_dict), 1))
+        for info_key, infoset in infoset_dict.items():
+            table[info_key] = infoset
+        return table
+
+    def __getstate__(self):
+        """Only pickle the used rows of the arrays."""
+        size = len(self.id_to_key)
+        return {'id_to_key': self.id_to_key, 'all_regrets': self.all_regrets[:size].copy(),
+                'all_strategy_sum': self.all_strategy_sum[:size].copy()}
+
+    def __setstate__(self, state):
+        """Restore a pickled table and rebuild the key to id mapping."""
+        self.id_to_key = state['id_to_key']
+        self.key_to_id = {info_key: info_id for info_id, info_key in enumerate(self.id_to_key)}
+        self.all_regrets = state['all_regrets']
+        self.all_strategy_sum = state['all_strategy_sum']
+        if len(self.all_regrets) == 0:
+            self._grow()
+
+    def _grow(self):
+        """Double the number of rows of the arrays. Views on the old arrays are no longer updated after this."""
+        capacity = max(2 * len(self.all_regrets), 1)
+        for name in ('all_regrets', 'all_strategy_sum'):
+            old = getattr(self, name)
+            new = np.zeros((capacity, old.shape[1]), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def get_id(self, info_key):
+        """Return the id of an info_key, adding a row for it if needed."""
+        info_id = self.key_to_id.get(info_key)
+        if info_id is None:
+            info_id = len(self.id_to_key)
+            if info_id == len(self.all_regrets):
+                self._grow()
+            self.key_to_id[info_key] = info_id
+            self.id_to_key.append(info_key)
+        return info_id
+
+    def __len__(self):
+        """Return the number of infosets in the table."""
+        return len(self.id_to_key)
+
+    def __contains__(self, info_key):
+        """Return whether the table has a row for info_key."""
+        return info_key in self.key_to_id
+
+    def __iter__(self):
+        """Iterate over the info_keys in order of their ids."""
+        return iter(self.id_to_key)
+
+    def __getitem__(self, info_key):
+        """Return an infoset which is a view on the row of info_key. The view is valid until the next new info_key
+        is added to the table."""
+        info_id = self.key_to_id[info_key]
+        num_actions = info_key[4]
+        return Infoset(info_key, self.all_regrets[info_id, :num_actions], self.all_strategy_sum[info_id, :num_actions])
+
+    def __setitem__(self, info_key, infoset):
+        """Copy the regrets and strategy sum of an infoset into the row of info_key."""
+        info_id = self.get_id(info_key)
+        num_actions = info_key[4]
+        self.all_regrets[info_id, :num_actions] = infoset.cumulative_regrets
+        self.all_strategy_sum[info_id, :num_actions] = infoset.strategy_sum
+
+    def keys(self):
+        """Return the info_keys in order of their ids."""
+        return list(self.id_to_key)
+
+    def values(self):
+        """Return a view on every infoset, in order of their ids."""
+        return [self[info_key] for info_key in self.id_to_key]
+
+    def items(self):
+        """Return (info_key, infoset view) pairs, in order of their ids."""
+        return [(info_key, self[info_key]) for info_key in self.id_to_key]
+
+    def copy(self):
+        """Return an independent copy of the table."""
+        table = InfosetTable(self.all_regrets.shape[1], 1)
+        table.key_to_id = self.key_to_id.copy()
+        table.id_to_key = self.id_to_key.copy()
+        table.all_regrets = self.all_regrets.copy()
+        table.all_strategy_sum = self.all_strategy_sum.copy()
+        return table
+
+    def snapshot(self):
+        """Copy the used rows of the table, so the table can be restored later."""
+        size = len(self.id_to_key)
+        return size, self.all_regrets[:size].copy(), self.all_strategy_sum[:size].copy()
+
+    def restore(self, snapshot):
+        """Restore the table from a snapshot, removing the info_keys which were added after it was taken."""
+        size, regrets, strategy_sum = snapshot
+        for info_key in self.id_to_key[size:]:
+            del self.key_to_id[info_key]
+        del self.id_to_key[size:]
+        self.all_regrets[:size] = regrets
+        self.all_regrets[size:] = 0
+        self.all_strategy_sum[:size] = strategy_sum
+        self.all_strategy_sum[size:] = 0
+
+    def merge(self, info_keys, regrets, strategy_sum):
+        """Add regrets and strategy sums gathered on a copy of this table. The first rows of the given arrays belong to
+        the ids the table had when it was copied, the remaining rows to info_keys, which were added to the copy."""
+        size = len(regrets) - len(info_keys)
+        self.all_regrets[:size] += regrets[:size]
+        self.all_strategy_sum[:size] += strategy_sum[:size]
+        for row, info_key in enumerate(info_keys, size):
+            info_id = self.get_id(info_key)
+            self.all_regrets[info_id] += regrets[row]
+            self.all_strategy_sum[info_id] += strategy_sum[row]
+
+    def scale(self, factor):
+        """Multiply all regrets and strategy sums by a factor."""
+        size = len(self.id_to_key)
+        self.all_regrets[:size] *= factor
+        self.all_strategy_sum[:size] *= factor
@@ -2,249 +2,534 @@ import math
 import numpy as np
 from tqdm import tqdm
 import random
-from copy import deepcopy
 import itertools
-from Infoset import Infoset
+from Infoset import normalize, regret_matching, make_info_key, upgrade_info_key
+from InfosetTable import InfosetTable
+from GameTree import GameTree
 import pickle
 import os
+import multiprocessing
+
+
+# Action counts for which the node update of the CFR recursions is generated with unrolled arithmetic.
+SPECIALIZED_ACTION_COUNTS = (2, 3)
+
+
+def _strategy_lines(num_actions):
+    """Function which returns the generated lines of a node update that compute the strategy s0, s1, ... by regret
+    matching and add it to the strategy sum. Expects player, reach0, reach1 and info_id to be defined."""
+    actions = range(num_actions)
+    lines = ["    player_reach, opponent_reach = (reach0, reach1) if player == 0 else (reach1, reach0)",
+             "    regrets = self.infoset_dict.all_regrets[info_id]"]
+    for i in actions:
+        lines += [f"    p{i} = float(regrets[{i}])",
+                  f"    p{i} = p{i} if p{i} > 0 else 0.0"]
+    lines += [f"    total = {' + '.join(f'p{i}' for i in actions)}",
+              "    if total > 0:"]
+    lines += [f"        s{i} = p{i} / total" for i in actions]
+    lines += ["    else:"]
+    lines += [f"        s{i} = {1 / num_actions!r}" for i in actions]
+    lines += ["    strategy_sum = self.infoset_dict.all_strategy_sum[info_id]"]
+    lines += [f"    strategy_sum[{i}] += player_reach * s{i}" for i in actions]
+    return lines
+
+
+def _regret_lines(num_actions):
+    """Function which returns the generated lines of a node update that weigh the action values v0, v1, ... by the
+    strategy, update the regrets and return the node value."""
+    actions = range(num_actions)
+    lines = [f"    node_value = {' + '.join(f'v{i} * s{i}' for i in actions)}",
+             "    regrets = self.infoset_dict.all_regrets[info_id]"]
+    lines += [f"    regrets[{i}] += opponent_reach * (v{i} - node_value)" for i in actions]
+    lines += ["    return node_value"]
+    return lines
+
+
+def make_node_update(num_actions, recursion, extra_args=''):
+    """Function which generates the regret matching, recursion and regret update of a CFR node with num_actions
+    actions, as plain float arithmetic without numpy calls. recursion is the name of the MCCFR method to recurse
+    with and extra_args are the arguments it takes after the reach probabilities."""
+    lines = [f"def node_update(self, game_state, possible_actions, info_id, reach0, reach1{extra_args}):",
+             "    player = game_state[0]"]
+    lines += _strategy_lines(num_actions)
+    lines += ["    return_value = -1"]
+    for i in range(num_actions):
+        lines += [f"    next_game_state = self.game.get_next_game_state(game_state, possible_actions[{i}])",
+                  "    if player == next_game_state[0]:",
+                  "        return_value = 1",
+                  "    if player == 0:",
+                  f"        v{i} = return_value * self.{recursion}(next_game_state, reach0 * s{i}, reach1{extra_args})",
+                  "    else:",
+                  f"        v{i} = return_value * self.{recursion}(next_game_state, reach0, reach1 * s{i}{extra_args})"]
+    lines += _regret_lines(num_actions)
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["node_update"]
+
+
+def make_tree_node_update(num_actions):
+    """Function which generates the node update of chance sampled MCCFR on a game tree with num_actions actions, like
+    make_node_update does for the game."""
+    lines = ["def node_update(self, tree, tree_ids, node, player, info_id, reach0, reach1):"]
+    lines += _strategy_lines(num_actions)
+    lines += ["    children = tree.children[node].tolist()",
+              "    edge_sign = tree.edge_sign[node].tolist()"]
+    for i in range(num_actions):
+        lines += ["    if player == 0:",
+                  f"        v{i} = edge_sign[{i}] * self.tree_chance_cfr(tree, tree_ids, children[{i}], reach0 * s{i}, reach1)",
+                  "    else:",
+                  f"        v{i} = edge_sign[{i}] * self.tree_chance_cfr(tree, tree_ids, children[{i}], reach0, reach1 * s{i})"]
+    lines += _regret_lines(num_actions)
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["node_update"]
+
+
+_chance_node_updates = {k: make_node_update(k, 'chance_cfr') for k in SPECIALIZED_ACTION_COUNTS}
+_external_node_updates = {k: make_node_update(k, 'external_cfr', ', update_player') for k in SPECIALIZED_ACTION_COUNTS}
+_tree_node_updates = {k: make_tree_node_update(k) for k in SPECIALIZED_ACTION_COUNTS}
 
 
 class MCCFR:
     """Class to run the MCCFR algorithm."""
 
-    def __init__(self, game, abstraction_function):
-        """Initialize a game, a dictionary containing the strategy profile and an abstraction function."""
+    def __init__(self, game, abstraction_function, discount_period=0, initial_discount=None, max_cached_trees=0,
+                 max_cached_keys=100000):
+        """Initialize a game, a table containing the strategy profile and an abstraction function.
+        discount_period: number of visited nodes between two discounts of the regrets and strategy sums, 0 disables it
+        initial_discount: number of discounts after which discounting stops, None to keep discounting
+        max_cached_trees: number of game trees of deals kept for chance sampled training and evaluation, 0 disables
+        it. This only pays off when the cache can hold most of the deals of the game.
+        max_cached_keys: number of game states for which the info_key is cached, the cache is emptied when it is full"""
         self.game = game
-        self.infoset_dict = {}
+        self.infoset_dict = InfosetTable(self.game.handsize + 1)
         self.abstraction_function = abstraction_function
         self.infoset_data = (self.infoset_dict, self.abstraction_function)
+        self._key_cache = {}
+        self.max_cached_keys = max_cached_keys
+        self.discount_period = discount_period
+        self.initial_discount = initial_discount
+        self.node_counter = 0
+        self.discount_count = 0
+        self._eval_splits = None
+        self._eval_scale = None
+        self.max_cached_trees = max_cached_trees
+        self._tree_cache = {}
+
+        # Scratch buffers for the action values, one per depth (history length) of the game tree.
+        self._cf_scratch = [np.zeros(self.game.handsize + 1, dtype=np.float32) for _ in range(2 * self.game.handsize + 2)]
 
     def get_infoset(self, info_key):
-        """Create an infoset if needed and return."""
-        if info_key not in self.infoset_dict:
-            self.infoset_dict[info_key] = Infoset(info_key)
+        """Create an infoset if needed and return a view on it."""
+        self.infoset_dict.get_id(info_key)
         return self.infoset_dict[info_key]
 
-    def get_info_key(self, game_state):
+    def get_info_key(self, game_state, possible_action=None):
         """Function which generates an info_key, given a game_state. First the suits are abstracted using the
-        suit dict, after which the abstraction function is used for further abstraction."""
-        possible_action = self.game.get_possible_actions(game_state)
-        possible_action_len = len(possible_action)
-        new_hand, new_trump, new_hist = self.game.translate_suits(game_state)
-        abs_hand, abs_trump, abs_hist = self.abstraction_function(new_hand, new_trump, new_hist, possible_action, self.game.mean)
-        key = (game_state[0], frozenset(abs_hand), abs_trump, abs_hist, possible_action_len)
+        suit dict, after which the abstraction function is used for further abstraction. The key only depends on
+        the active player, their hand, the trump and the history, so it is cached on those, for at most
+        max_cached_keys game states."""
+        state_key = (game_state[0], tuple(game_state[1][game_state[0]]), game_state[1][2], game_state[2])
+        key = self._key_cache.get(state_key)
+        if key is None:
+            if possible_action is None:
+                possible_action = self.game.get_possible_actions(game_state)
+            possible_action_len = len(possible_action)
+            new_hand, new_trump, new_hist = self.game.translate_suits(game_state)
+            abs_hand, abs_trump, abs_hist = self.abstraction_function(new_hand, new_trump, new_hist, possible_action, self.game.mean)
+            key = make_info_key(game_state[0], abs_hand, abs_trump, abs_hist, possible_action_len)
+            if len(self._key_cache) >= self.max_cached_keys:
+                self._key_cache.clear()
+            self._key_cache[state_key] = key
         return key
 
-    def chance_cfr(self, game_state, reach_probs):
+    def sample_action_index(self, strategy):
+        """Function which samples the index of an action from a strategy by inverting its cumulative distribution,
+        using the random generator of the game. Small strategies are walked in plain Python, since numpy calls cost
+        more than they save there. The threshold is scaled by the sum of the strategy, since float32 rounding can
+        leave that sum just below 1."""
+        if len(strategy) <= 4:
+            action_probs = strategy.tolist()
+            threshold = self.game.rng.random() * sum(action_probs)
+            cumulative = 0
+            for ix, action_prob in enumerate(action_probs):
+                cumulative += action_prob
+                if threshold < cumulative:
+                    return ix
+        else:
+            cumulative = np.cumsum(strategy)
+            ix = int(np.searchsorted(cumulative, self.game.rng.random() * cumulative[-1], side='right'))
+            if ix < len(strategy):
+                return ix
+        # Rounding can still put the threshold at the total, then take the last action that can be played
+        return int(np.flatnonzero(strategy)[-1])
+
+    def skip_forced_actions(self, game_state):
+        """Function which follows the game from game_state as long as only one action is possible. Returns the first
+        game state with a choice or a terminal game state, its possible actions (None if terminal) and the sign
+        which converts values of the active player there to values of the active player in the given game state."""
+        sign = 1
+        while not game_state[4]:
+            possible_actions = self.game.get_possible_actions(game_state)
+            if len(possible_actions) != 1:
+                return game_state, possible_actions, sign
+            next_game_state = self.game.get_next_game_state(game_state, possible_actions[0])
+            if game_state[0] != next_game_state[0]:
+                sign = -sign
+            game_state = next_game_state
+        return game_state, None, sign
+
+    def chance_cfr(self, game_state, reach0, reach1):
         """Recursive function for chance sampled MCCFR."""
+        self.node_counter += 1
+
+        # If only 1 possible action, no strategy required.
+        game_state, possible_actions, sign = self.skip_forced_actions(game_state)
 
         # Base case
         if game_state[4]:
-            return self.game.get_payoff(game_state)
+            return sign * self.game.get_payoff(game_state)
 
-        possible_actions = self.game.get_possible_actions(game_state)
-        counterfactual_values = np.zeros(len(possible_actions))
-        return_value = -1
-
-        # If only 1 possible action, no strategy required.
-        if len(possible_actions) == 1:
-            next_game_state = self.game.get_next_game_state(game_state, possible_actions[0])
-            if game_state[0] == next_game_state[0]:
-                return_value = 1
-            node_value = return_value * self.chance_cfr(next_game_state, reach_probs)
+        info_key = self.get_info_key(game_state, possible_actions)
+        info_id = self.infoset_dict.get_id(info_key)
+        num_actions = len(possible_actions)
 
-        else:
-            player = game_state[0]
-            opponent = (player + 1) % 2
-            info_key = self.get_info_key(game_state)
-            infoset = self.get_infoset(info_key)
-            strategy = infoset.regret_matching()
-            infoset.update_strategy_sum(reach_probs[player])
+        # Common action counts have a generated node update
+        if num_actions in _chance_node_updates:
+            return sign * _chance_node_updates[num_actions](self, game_state, possible_actions, info_id, reach0, reach1)
 
-            for ix, action in enumerate(possible_actions):
-                action_prob = strategy[ix]
+        return_value = -1
+        player = game_state[0]
+        player_reach, opponent_reach = (reach0, reach1) if player == 0 else (reach1, reach0)
+        strategy = regret_matching(self.infoset_dict.all_regrets[info_id, :num_actions])
+        self.infoset_dict.all_strategy_sum[info_id, :num_actions] += player_reach * strategy
+        counterfactual_values = self._cf_scratch[len(game_state[2])][:len(possible_actions)]
 
-                # Compute new reach probabilities after this action
-                new_reach_probs = reach_probs.copy()
-                new_reach_probs[player] *= action_prob
+        for ix, action in enumerate(possible_actions):
+            action_prob = strategy[ix]
 
-                # recursively call MCCFR
-                next_game_state = self.game.get_next_game_state(game_state, action)
-                if game_state[0] == next_game_state[0]:
-                    return_value = 1
-                counterfactual_values[ix] = return_value * self.chance_cfr(next_game_state, new_reach_probs)
+            # recursively call MCCFR with the reach probability of the player scaled by this action
+            next_game_state = self.game.get_next_game_state(game_state, action)
+            if game_state[0] == next_game_state[0]:
+                return_value = 1
+            if player == 0:
+                value = self.chance_cfr(next_game_state, reach0 * action_prob, reach1)
+            else:
+                value = self.chance_cfr(next_game_state, reach0, reach1 * action_prob)
+            counterfactual_values[ix] = return_value * value
 
-            # Value of the current game state is counterfactual values weighted by the strategy
-            node_value = counterfactual_values.dot(strategy)
+        # Value of the current game state is counterfactual values weighted by the strategy
+        node_value = float(np.dot(counterfactual_values, strategy))
 
-            for ix, action in enumerate(possible_actions):
-                infoset.cumulative_regrets[ix] += reach_probs[opponent] * (counterfactual_values[ix] - node_value)
-        return node_value
+        # The arrays may have been reallocated by the recursion, so index the table again
+        self.infoset_dict.all_regrets[info_id, :num_actions] += opponent_reach * (counterfactual_values - node_value)
+        return sign * node_value
 
-    def external_cfr(self, game_state, reach_probs, update_player):
+    def external_cfr(self, game_state, reach0, reach1, update_player):
         """Recursive function for external sampled MCCFR."""
+        self.node_counter += 1
+
+        # If only 1 possible action, no strategy required.
+        game_state, possible_actions, sign = self.skip_forced_actions(game_state)
 
         # Base case
         if game_state[4]:
-            return self.game.get_payoff(game_state)
+            return sign * self.game.get_payoff(game_state)
+
+        player = game_state[0]
+        info_key = self.get_info_key(game_state, possible_actions)
+        info_id = self.infoset_dict.get_id(info_key)
+        num_actions = len(possible_actions)
+
+        # Common action counts have a generated node update for the updated player
+        if player == update_player and num_actions in _external_node_updates:
+            return sign * _external_node_updates[num_actions](self, game_state, possible_actions, info_id, reach0, reach1,
+                                                              update_player)
 
-        possible_actions = self.game.get_possible_actions(game_state)
-        counterfactual_values = np.zeros(len(possible_actions))
         return_value = -1
+        player_reach, opponent_reach = (reach0, reach1) if player == 0 else (reach1, reach0)
+        strategy = regret_matching(self.infoset_dict.all_regrets[info_id, :num_actions])
 
-        # If only 1 possible action, no strategy required.
-        if len(possible_actions) == 1:
-            next_game_state = self.game.get_next_game_state(game_state, possible_actions[0])
+        # External gets sampled
+        if player != update_player:
+            action_index = self.sample_action_index(strategy)
+            action = possible_actions[action_index]
+            action_prob = strategy[action_index]
+
+            next_game_state = self.game.get_next_game_state(game_state, action)
             if game_state[0] == next_game_state[0]:
                 return_value = 1
-            node_value = return_value * self.external_cfr(next_game_state, reach_probs, update_player)
+            if player == 0:
+                value = self.external_cfr(next_game_state, reach0 * action_prob, reach1, update_player)
+            else:
+                value = self.external_cfr(next_game_state, reach0, reach1 * action_prob, update_player)
+            node_value = return_value * value
 
         else:
-            player = game_state[0]
-            opponent = (game_state[0] + 1) % 2
-            info_key = self.get_info_key(game_state)
-            infoset = self.get_infoset(info_key)
-            strategy = infoset.regret_matching()
-
-            # External gets sampled
-            if player != update_player:
-                action = random.choices(possible_actions, strategy)[0]
-                action_index = list(possible_actions).index(action)
-                action_prob = strategy[action_index]
-
-                # compute new reach probabilities after this action
-                new_reach_probs = reach_probs.copy()
-                new_reach_probs[player] *= action_prob
+            self.infoset_dict.all_strategy_sum[info_id, :num_actions] += player_reach * strategy
+            counterfactual_values = self._cf_scratch[len(game_state[2])][:len(possible_actions)]
+            for ix, action in enumerate(possible_actions):
+                action_prob = strategy[ix]
 
+                # recursively call MCCFR with the reach probability of the player scaled by this action
                 next_game_state = self.game.get_next_game_state(game_state, action)
                 if game_state[0] == next_game_state[0]:
                     return_value = 1
-                node_value = return_value * self.external_cfr(next_game_state, new_reach_probs, update_player)
-
-            else:
-                infoset.update_strategy_sum(reach_probs[player])
-                for ix, action in enumerate(possible_actions):
-                    action_prob = strategy[ix]
+                if player == 0:
+                    value = self.external_cfr(next_game_state, reach0 * action_prob, reach1, update_player)
+                else:
+                    value = self.external_cfr(next_game_state, reach0, reach1 * action_prob, update_player)
+                counterfactual_values[ix] = return_value * value
 
-                    # compute new reach probabilities after this action
-                    new_reach_probs = reach_probs.copy()
-                    new_reach_probs[player] *= action_prob
+            # Value of the current game state is counterfactual values weighted by the strategy
+            node_value = float(np.dot(counterfactual_values, strategy))
+
+            # The arrays may have been reallocated by the recursion, so index the table again
+            self.infoset_dict.all_regrets[info_id, :num_actions] += opponent_reach * (counterfactual_values - node_value)
+        return sign * node_value
+
+    def get_tree(self, game_state):
+        """Return the cached game tree of the deal of an initial game state, building it if there is room in the
+        cache. Returns None if the cache is full and the deal is not in it."""
+        deal = (tuple(game_state[1][0]), tuple(game_state[1][1]), game_state[1][2])
+        tree = self._tree_cache.get(deal)
+        if tree is None and len(self._tree_cache) < self.max_cached_trees:
+            tree = GameTree(self, game_state)
+            self._tree_cache[deal] = tree
+        return tree
+
+    def tree_ids(self, tree):
+        """Return the ids in the infoset table of the info keys of a game tree, creating infosets if needed. The ids
+        are looked up again for every traversal, since restoring a snapshot of the table can change them."""
+        return [self.infoset_dict.get_id(info_key) for info_key in tree.info_keys]
+
+    def tree_chance_cfr(self, tree, tree_ids, node, reach0, reach1):
+        """Recursive function for chance sampled MCCFR on a cached game tree, which does the same updates as
+        chance_cfr using only array indexing."""
+        self.node_counter += 1
 
-                    # recursively call MCCFR
-                    next_game_state = self.game.get_next_game_state(game_state, action)
-                    if game_state[0] == next_game_state[0]:
-                        return_value = 1
-                    counterfactual_values[ix] = return_value * self.external_cfr(next_game_state, new_reach_probs, update_player)
+        # Base case
+        if tree.terminal[node]:
+            return float(tree.payoff[node])
+
+        num_actions = int(tree.n_children[node])
+        player = int(tree.player[node])
+        info_id = tree_ids[tree.info_id[node]]
+
+        # Common action counts have a generated node update
+        if num_actions in _tree_node_updates:
+            return _tree_node_updates[num_actions](self, tree, tree_ids, node, player, info_id, reach0, reach1)
+
+        player_reach, opponent_reach = (reach0, reach1) if player == 0 else (reach1, reach0)
+        strategy = regret_matching(self.infoset_dict.all_regrets[info_id, :num_actions])
+        self.infoset_dict.all_strategy_sum[info_id, :num_actions] += player_reach * strategy
+        counterfactual_values = self._cf_scratch[tree.depth[node]][:num_actions]
+        children = tree.children[node].tolist()
+        edge_sign = tree.edge_sign[node].tolist()
+
+        for ix in range(num_actions):
+            action_prob = strategy[ix]
+
+            # recursively call MCCFR with the reach probability of the player scaled by this action
+            if player == 0:
+                value = self.tree_chance_cfr(tree, tree_ids, children[ix], reach0 * action_prob, reach1)
+            else:
+                value = self.tree_chance_cfr(tree, tree_ids, children[ix], reach0, reach1 * action_prob)
+            counterfactual_values[ix] = edge_sign[ix] * value
 
-                # Value of the current game state is counterfactual values weighted by the strategy
-                node_value = counterfactual_values.dot(strategy)
+        # Value of the current game state is counterfactual values weighted by the strategy
+        node_value = float(np.dot(counterfactual_values, strategy))
 
-                for ix, action in enumerate(possible_actions):
-                    infoset.cumulative_regrets[ix] += reach_probs[opponent] * (counterfactual_values[ix] - node_value)
+        # The arrays may have been reallocated by the recursion, so index the table again
+        self.infoset_dict.all_regrets[info_id, :num_actions] += opponent_reach * (counterfactual_values - node_value)
         return node_value
 
     def train_chance(self, num_iterations):
-        """Train chance mccfr by calling the recursive function, iteration number of times."""
+        """Train chance mccfr by calling the recursive function, iteration number of times. Deals with a cached game
+        tree are traversed on the tree instead of through the game."""
         util = 0
         for _ in range(num_iterations):
             game_state = self.game.sample_new_game()
-            reach_probs = np.ones(2)
-            util += self.chance_cfr(game_state, reach_probs)
+            tree = self.get_tree(game_state)
+            if tree is None:
+                util += self.chance_cfr(game_state, 1.0, 1.0)
+            else:
+                util += tree.root_sign * self.tree_chance_cfr(tree, self.tree_ids(tree), 0, 1.0, 1.0)
+            self.discount()
         return util / num_iterations
 
+    def external_iteration(self):
+        """Run a single iteration of external mccfr, which updates both players once, and return the summed utility."""
+        util = 0
+        for i in range(2):
+            game_state = self.game.sample_new_game()
+            util += self.external_cfr(game_state, 1.0, 1.0, i)
+        self.discount()
+        return util
+
     def train_external(self, num_iterations):
         """Train external mccfr by calling the recursive function, iteration number of times."""
         util = 0
-        for _ in tqdm(range(num_iterations)):
-            for i in range(2):
-                game_state = self.game.sample_new_game()
-                reach_probs = np.ones(2)
-                util += self.external_cfr(game_state, reach_probs, i)
+        for _ in tqdm(range(num_iterations), miniters=max(1, num_iterations // 200), mininterval=0.5):
+            util += self.external_iteration()
+        return util / (num_iterations * 2)
+
+    def train_external_parallel(self, num_iterations, num_workers=None, round_iterations=1000):
+        """Train external mccfr on multiple processes. The iterations are run in rounds of round_iterations, in which
+        every worker trains on its own copy of the current strategy profile. After each round the changes in regrets
+        and strategy sums of all workers are summed into the infoset table."""
+        if num_workers is None:
+            num_workers = os.cpu_count()
+        util = 0
+        with multiprocessing.Pool(num_workers, _init_worker, (self.game, self.abstraction_function)) as pool:
+            for start in tqdm(range(0, num_iterations, round_iterations)):
+                iterations = min(round_iterations, num_iterations - start)
+                split = [iterations // num_workers + (i < iterations % num_workers) for i in range(num_workers)]
+                tasks = [(self.infoset_dict, n, int(self.game.rng.integers(2 ** 32))) for n in split if n > 0]
+                for worker_util, new_keys, regrets, strategy_sum, node_count in pool.map(_train_external_worker, tasks):
+                    util += worker_util
+                    self.node_counter += node_count
+                    self.infoset_dict.merge(new_keys, regrets, strategy_sum)
+                self.discount()
         return util / (num_iterations * 2)
 
+    def discount(self):
+        """Discount the regrets and strategy sums as in Linear CFR, for every discount_period nodes visited since the
+        last discount. At the n-th discount both are multiplied by n / (n + 1), which lowers the weight of the early
+        iterations."""
+        if not self.discount_period:
+            return
+        while self.node_counter >= (self.discount_count + 1) * self.discount_period:
+            if self.initial_discount is not None and self.discount_count >= self.initial_discount:
+                return
+            self.discount_count += 1
+            factor = self.discount_count / (self.discount_count + 1)
+            self.infoset_dict.scale(factor)
+
     def count_infosets(self):
         """Function which counts the number of information sets in the dict"""
-        p1_count = len([x for x, _ in self.infoset_dict.items() if x[0] == 0])
-        p2_count = len(self.infoset_dict.items()) - p1_count
+        p1_count = len([x for x in self.infoset_dict if x[0] == 0])
+        p2_count = len(self.infoset_dict) - p1_count
         return p1_count, p2_count
 
     def evaluate_helper(self, game_state, reach_prob):
         """Function which recursively finds the expected utility."""
 
+        # If only 1 possible action, no strategy required.
+        game_state, possible_actions, sign = self.skip_forced_actions(game_state)
+
         # Base case
         if game_state[4]:
-            return self.game.get_payoff(game_state)
+            return sign * self.game.get_payoff(game_state)
 
-        possible_actions = self.game.get_possible_actions(game_state)
-        partial_values = np.zeros(len(possible_actions))
         return_value = -1
+        info_key = self.get_info_key(game_state, possible_actions)
+        info_id = self.infoset_dict.get_id(info_key)
+        strategy = normalize(self.infoset_dict.all_strategy_sum[info_id, :len(possible_actions)].copy())
+        partial_values = self._cf_scratch[len(game_state[2])][:len(possible_actions)]
 
-        # If only 1 possible action, no strategy required.
-        if len(possible_actions) == 1:
-            next_game_state = self.game.get_next_game_state(game_state, possible_actions[0])
-            if game_state[0] == next_game_state[0]:
-                return_value = 1
-            node_value = return_value * self.evaluate_helper(next_game_state, reach_prob)
+        for ix, action in enumerate(possible_actions):
+            action_prob = strategy[ix]
 
-        else:
-            info_key = self.get_info_key(game_state)
-            infoset = self.get_infoset(info_key)
-            strategy = infoset.get_average_strategy()
+            # compute new reach probabilities after this action
+            new_reach_prob = reach_prob
+            new_reach_prob *= action_prob
 
-            for ix, action in enumerate(possible_actions):
-                action_prob = strategy[ix]
+            # recursively call evaluate function
+            next_game_state = self.game.get_next_game_state(game_state, action)
+            if game_state[0] == next_game_state[0]:
+                return_value = 1
+            partial_values[ix] = return_value * self.evaluate_helper(next_game_state, new_reach_prob)
 
-                # compute new reach probabilities after this action
-                new_reach_prob = reach_prob
-                new_reach_prob *= action_prob
+        # Value of the current game state is counterfactual values weighted by the strategy
+        node_value = float(np.dot(partial_values, strategy))
+        return sign * node_value
 
-                # recursively call evaluate function
-                next_game_state = self.game.get_next_game_state(game_state, action)
-                if game_state[0] == next_game_state[0]:
-                    return_value = 1
-                partial_values[ix] = return_value * self.evaluate_helper(next_game_state, new_reach_prob)
+    def tree_evaluate(self, tree, tree_ids, node):
+        """Function which recursively finds the expected utility on a game tree, like evaluate_helper."""
 
-            # Value of the current game state is counterfactual values weighted by the strategy
-            node_value = partial_values.dot(strategy)
-        return node_value
+        # Base case
+        if tree.terminal[node]:
+            return float(tree.payoff[node])
+
+        num_actions = tree.n_children[node]
+        info_id = tree_ids[tree.info_id[node]]
+        strategy = normalize(self.infoset_dict.all_strategy_sum[info_id, :num_actions].copy())
+        partial_values = self._cf_scratch[tree.depth[node]][:num_actions]
+        children = tree.children[node].tolist()
+        edge_sign = tree.edge_sign[node].tolist()
+
+        for ix in range(num_actions):
+            partial_values[ix] = edge_sign[ix] * self.tree_evaluate(tree, tree_ids, children[ix])
+
+        # Value of the current game state is counterfactual values weighted by the strategy
+        return float(np.dot(partial_values, strategy))
+
+    def hand_splits(self):
+        """Function which returns every way to split 2 * handsize dealt cards into two hands, as two arrays of
+        indices into the dealt cards. Row i of the first array is the hand of player 0, row i of the second array
+        contains the remaining cards."""
+        dealt_size = self.game.handsize * 2
+        hand1_ids = np.array(list(itertools.combinations(range(dealt_size), self.game.handsize)))
+        mask = np.ones((len(hand1_ids), dealt_size), dtype=bool)
+        mask[np.arange(len(hand1_ids))[:, None], hand1_ids] = False
+        hand2_ids = np.nonzero(mask)[1].reshape(len(hand1_ids), self.game.handsize)
+        return hand1_ids, hand2_ids
+
+    def evaluation_scale(self):
+        """Function which returns the factor that turns the summed utility of the evaluation states into the expected
+        utility, computed on first use and cached."""
+        if self._eval_scale is None:
+            hand_prob = (len(self.game.deck.deck2) *
+                         math.comb(len(self.game.deck.deck2) - 1, self.game.handsize) *
+                         math.comb(len(self.game.deck.deck2) - self.game.handsize - 1, self.game.handsize))
+            self._eval_scale = len(self.game.deck.suit) / hand_prob
+        return self._eval_scale
+
+    def evaluation_states(self):
+        """Generator which yields the initial game states of every deal with a trump of the first suit. Only the hand
+        splits are cached, the game states are built when they are needed, since there can be very many."""
+        if self._eval_splits is None:
+            self._eval_splits = self.hand_splits()
+        hand1_ids, hand2_ids = self._eval_splits
+        for trump in self.game.deck.ranks:
+            trump_card = (self.game.deck.suit[0], trump)
+            cards = [card for card in self.game.deck.deck2 if card != trump_card]
+            for dealt_ids in itertools.combinations(range(len(cards)), self.game.handsize * 2):
+                dealt_ids = np.array(dealt_ids)
+                for hand1, hand2 in zip(dealt_ids[hand1_ids].tolist(), dealt_ids[hand2_ids].tolist()):
+                    hands = [sorted(cards[i] for i in hand1), sorted(cards[i] for i in hand2), trump_card]
+                    yield self.game.sample_new_game(hands=hands)
 
     def evaluate(self):
         """Evaluates the current infodict by multiplying the probabilities of the
-        terminal nodes with the utilities of those nodes"""
-        hand_prob = (len(self.game.deck.deck2) *
-                     math.comb(len(self.game.deck.deck2) - 1, self.game.handsize) *
-                     math.comb(len(self.game.deck.deck2) - self.game.handsize - 1, self.game.handsize))
+        terminal nodes with the utilities of those nodes. Deals with a cached game tree are evaluated on the tree."""
+        scale = self.evaluation_scale()
         util = 0
-        for trump in self.game.deck.ranks:
-            self.game.deck.reset_deck()
-            self.game.deck.deck1.remove((self.game.deck.suit[0], trump))
-            for dealt_cards in itertools.combinations(self.game.deck.deck1, self.game.handsize * 2):
-                for hand1 in itertools.combinations(dealt_cards, self.game.handsize):
-                    hand2 = list(card for card in dealt_cards if card not in hand1)
-                    
-                    hands = [sorted(list(hand1)), sorted(hand2), (self.game.deck.suit[0], trump)]
-                    game_state = self.game.sample_new_game(hands=hands)
-
-                    reach_prob = 1
-                    util += self.evaluate_helper(game_state, reach_prob)
-        return len(self.game.deck.suit) * util / hand_prob
+        for game_state in self.evaluation_states():
+            tree = self.get_tree(game_state)
+            if tree is None:
+                util += self.evaluate_helper(game_state, 1)
+            else:
+                util += tree.root_sign * self.tree_evaluate(tree, self.tree_ids(tree), 0)
+        return scale * util
 
     def get_exploitability(self, num_iterations):
         """Use MCCFR to update just one player and evaluate after. Doing this for both players approximates the
         exploitability."""
-        info_dict_copy = deepcopy(self.infoset_dict)
+        snapshot = self.infoset_dict.snapshot()
+        node_counter = self.node_counter
         for _ in range(num_iterations):
             game_state = self.game.sample_new_game()
-            reach_probs = np.ones(2)
-            self.external_cfr(game_state, reach_probs, 0)
+            self.external_cfr(game_state, 1.0, 1.0, 0)
         b_1 = self.evaluate()
-        self.infoset_dict = deepcopy(info_dict_copy)
+        self.infoset_dict.restore(snapshot)
         for _ in range(num_iterations):
             game_state = self.game.sample_new_game()
-            reach_probs = np.ones(2)
-            self.external_cfr(game_state, reach_probs, 1)
+            self.external_cfr(game_state, 1.0, 1.0, 1)
         b_2 = self.evaluate()
-        self.infoset_dict = deepcopy(info_dict_copy)
+        self.infoset_dict.restore(snapshot)
+        self.node_counter = node_counter
         return b_1 - b_2
 
     def save_dict(self, name):
@@ -252,13 +537,16 @@ class MCCFR:
         filename = f"Dicts/{name}.pkl"
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         a_file = open(filename, "wb")
-        pickle.dump(self.infoset_dict, a_file)
+        pickle.dump(self.infoset_dict, a_file, protocol=pickle.HIGHEST_PROTOCOL)
         a_file.close()
 
     def load_dict(self, name):
         """Load information dict as pickle."""
         a_file = open(f"Dicts/{name}.pkl", "rb")
         output = pickle.load(a_file)
+        if isinstance(output, dict):
+            output = {upgrade_info_key(info_key): infoset for info_key, infoset in output.items()}
+            output = InfosetTable.from_dict(output, self.game.handsize + 1)
         self.infoset_dict = output
         self.infoset_data = (self.infoset_dict, self.abstraction_function)
 
@@ -303,7 +591,7 @@ class MCCFR:
 
                     game_state = self.game.get_next_game_state(game_state, possible_actions[0])
                 else:
-                    info_key = self.get_info_key(game_state)
+                    info_key = self.get_info_key(game_state, possible_actions)
                     infoset = self.get_infoset(info_key)
                     strategy = infoset.get_average_strategy()
                     action = random.choices(possible_actions, strategy)[0]
@@ -359,3 +647,31 @@ class MCCFR:
             final = 'lost'
         print(f"You {final} the match by {abs(score1 - score2)} points.")
         return score1, score2
+
+
+_worker_mccfr = None
+
+
+def _init_worker(game, abstraction_function):
+    """Create the MCCFR instance of a worker process, so its info key cache is kept between rounds."""
+    global _worker_mccfr
+    _worker_mccfr = MCCFR(game, abstraction_function)
+
+
+def _train_external_worker(task):
+    """Run external mccfr iterations on a copy of the infoset table. Returns the summed utility, the info_keys the
+    copy added, the changes in regrets and strategy sums for every row of the copy and the number of visited nodes."""
+    infoset_table, num_iterations, seed = task
+    _worker_mccfr.game.rng = np.random.default_rng(seed)
+    _worker_mccfr.infoset_dict = infoset_table
+    _worker_mccfr.infoset_data = (infoset_table, _worker_mccfr.abstraction_function)
+    size, start_regrets, start_strategy_sum = infoset_table.snapshot()
+    _worker_mccfr.node_counter = 0
+    util = 0
+    for _ in range(num_iterations):
+        util += _worker_mccfr.external_iteration()
+
+    regrets, strategy_sum = infoset_table.snapshot()[1:]
+    regrets[:size] -= start_regrets
+    strategy_sum[:size] -= start_strategy_sum
+    return util, infoset_table.id_to_key[size:], regrets, strategy_sum, _worker_mccfr.node_counter
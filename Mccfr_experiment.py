@@ -13,6 +13,7 @@ train_iterations = 5000
 intervals = 400
 eval_iterations = 2500
 run_name = 'SmolTest1'
+max_cached_trees = 0
 FLAGS = None
 
 fast = True
@@ -24,7 +25,7 @@ def main():
                      FLAGS.train_iterations, FLAGS.intervals, FLAGS.eval_iterations, FLAGS.run_name)
     else:
         exploit(FLAGS.suits, FLAGS.ranks, FLAGS.hand_size, FLAGS.starting_iterations,
-                FLAGS.train_iterations, FLAGS.intervals, FLAGS.eval_iterations, FLAGS.run_name)
+                FLAGS.train_iterations, FLAGS.intervals, FLAGS.eval_iterations, FLAGS.run_name, FLAGS.max_cached_trees)
 
 
 if __name__ == '__main__':
@@ -50,6 +51,9 @@ if __name__ == '__main__':
                         help='Number of iterations for evaluation')
     parser.add_argument('--run_name', type=str, default=run_name,
                         help='Name for the run/saved infodict')
+    parser.add_argument('--max_cached_trees', type=int, default=max_cached_trees,
+                        help='Number of game trees kept for evaluation, at least the number of evaluation deals '
+                             'to evaluate on trees only, 0 to evaluate through the game')
     FLAGS, unparsed = parser.parse_known_args()
     if not fast:
         config.update(FLAGS)
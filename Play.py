@@ -1,4 +1,4 @@
-from Infoset import Infoset
+from Infoset import Infoset, make_info_key
 import random
 
 
@@ -24,7 +24,7 @@ class Play:
         possible_action_len = len(possible_action)
         new_hand, new_trump, new_hist = self.game.translate_suits(game_state)
         abs_hand, abs_trump, abs_hist = self.abstraction_functions[player](new_hand, new_trump, new_hist, possible_action, self.game.mean)
-        key = (game_state[0], frozenset(abs_hand), abs_trump, abs_hist, possible_action_len)
+        key = make_info_key(game_state[0], abs_hand, abs_trump, abs_hist, possible_action_len)
         return key
 
     def play_round(self, first_player):
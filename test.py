@@ -22,7 +22,7 @@ print(mccfr.count_infosets())
 # sd = {i: mccfr.infoset_dict[i] for i in infoset_dict_keys}
 # print(sd)
 # print(mccfr.infoset_dict)
-# print(f"{mccfr.infoset_dict[(1, frozenset({('first', 13)}), ('second', 12), (1,), 2)].regret_matching()}")
+# print(f"{mccfr.infoset_dict[(1, (('first', 13),), ('second', 12), (1,), 2)].regret_matching()}")
 mccfr.play_game(100)
 
 # print(new_game[1])